@@ -6,104 +6,1083 @@ This script downloads and registers CoreNLP language model JARs for use with Gal
 """
 
 import argparse
+import contextlib
+import errno
+import hashlib
+import importlib.util
+import http.client
 import json
 import os
 import sys
-import urllib.request
+import time
+import urllib.error
+from dataclasses import dataclass
 from pathlib import Path
+from urllib.parse import urljoin, urlsplit
 
+# Modules that are only needed to download files, such as threading,
+# subprocess and the optional aiohttp, are imported by the functions that use
+# them, so that runs where every model is already installed start quickly
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Separator line for the banners printed around each step
+SEPARATOR = "=" * 60
 
 # CoreNLP version and model information
 CORENLP_VERSION = "4.5.10"
 
+# Maximum number of simultaneous connections to Maven Central
+MAX_CONCURRENT_DOWNLOADS = 4
+
+# Shared content-addressable cache of downloaded JARs, laid out as
+# <cache dir>/<algorithm>/<digest>/<jar name>
+CACHE_DIR = Path(os.environ.get("CORENLP_CACHE_DIR", "~/.cache/corenlp")).expanduser()
+
+# Checksum sidecars published by Maven Central, in order of preference
+CHECKSUM_ALGORITHMS = ("sha256", "sha1")
+
+# A JAR (ZIP) file ends with an end of central directory record: a 22 byte
+# record starting with this signature, followed by a comment of up to 64 KiB
+ZIP_EOCD_SIGNATURE = b"PK\x05\x06"
+ZIP_EOCD_SEARCH_SIZE = 22 + 0xFFFF
+
+# Read/write buffer size for downloads; large buffers keep syscall counts low
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+
+# Minimum number of seconds between progress updates
+PROGRESS_INTERVAL = 1.0
+
+# Socket timeout in seconds for HTTP connections
+HTTP_TIMEOUT = 60
+
+# Download attempts per model before giving up, and the cap in seconds on the
+# exponential backoff between attempts
+DOWNLOAD_ATTEMPTS = 5
+MAX_RETRY_DELAY = 30
+
+# Client error statuses that are worth retrying; any other 4xx is permanent
+RETRY_STATUSES = {408, 429}
+
+# Statuses of a HEAD request that mean the model JAR does not exist
+MISSING_STATUSES = {404, 410}
+
+# Files at least this large are downloaded as several byte ranges in parallel
+SEGMENTED_DOWNLOAD_THRESHOLD = 64 << 20
+DOWNLOAD_SEGMENTS = 4
+
+# Minimum number of seconds between saves of a segmented download's progress
+SEGMENT_STATE_INTERVAL = 1.0
+
+# Maven Central directory holding the model JARs for this CoreNLP version
+MAVEN_BASE_URL = f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}"
+
+
+@dataclass(frozen=True)
+class ModelInfo:
+    """A model JAR that can be downloaded and registered in the data table."""
+
+    # Declared by hand rather than with dataclass(slots=True), which needs Python 3.10
+    __slots__ = ("code", "name", "jar_name", "url")
+
+    code: str
+    name: str
+    jar_name: str
+    url: str
+
+
+def _model_info(code, name, jar_suffix):
+    jar_name = f"stanford-corenlp-{CORENLP_VERSION}-models{jar_suffix}.jar"
+    return ModelInfo(code, name, jar_name, f"{MAVEN_BASE_URL}/{jar_name}")
+
+
 # Common models JAR (contains dcoref dictionaries and common models)
-COMMON_MODELS = {
-    "name": "Common Models",
-    "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models.jar",
-    "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models.jar"
-}
-
-LANGUAGE_MODELS = {
-    "ar": {
-        "name": "Arabic",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-arabic.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-arabic.jar"
-    },
-    "zh": {
-        "name": "Chinese",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-chinese.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-chinese.jar"
-    },
-    "en": {
-        "name": "English",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-english.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-english.jar"
-    },
-    "fr": {
-        "name": "French",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-french.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-french.jar"
-    },
-    "de": {
-        "name": "German",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-german.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-german.jar"
-    },
-    "hu": {
-        "name": "Hungarian",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-hungarian.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-hungarian.jar"
-    },
-    "it": {
-        "name": "Italian",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-italian.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-italian.jar"
-    },
-    "es": {
-        "name": "Spanish",
-        "jar_name": f"stanford-corenlp-{CORENLP_VERSION}-models-spanish.jar",
-        "url": f"https://repo1.maven.org/maven2/edu/stanford/nlp/stanford-corenlp/{CORENLP_VERSION}/stanford-corenlp-{CORENLP_VERSION}-models-spanish.jar"
-    }
-}
+COMMON_MODELS = _model_info("common", "Common Models", "")
+
+# (language code, display name, JAR suffix) for each language model
+LANGUAGES = (
+    ("ar", "Arabic", "-arabic"),
+    ("zh", "Chinese", "-chinese"),
+    ("en", "English", "-english"),
+    ("fr", "French", "-french"),
+    ("de", "German", "-german"),
+    ("hu", "Hungarian", "-hungarian"),
+    ("it", "Italian", "-italian"),
+    ("es", "Spanish", "-spanish"),
+)
+
+LANGUAGE_MODELS = {code: _model_info(code, name, suffix) for code, name, suffix in LANGUAGES}
+
 
+class ConnectionPool:
+    """
+    Persistent HTTP(S) connections, one per host.
 
-def download_model(url, target_path):
+    All model JARs live on the same host, so reusing a single keep-alive
+    connection saves a TCP and TLS handshake for every request after the first.
+    """
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, timeout=HTTP_TIMEOUT):
+        self.timeout = timeout
+        self._connections = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+    @contextlib.contextmanager
+    def open(self, url, headers=None, method="GET"):
+        """
+        Send a request and yield the response.
+
+        Redirects are followed and error statuses raise urllib.error.HTTPError,
+        the same as urllib.request.urlopen().
+        """
+        for _ in range(self.MAX_REDIRECTS + 1):
+            key, response = self._request(method, url, headers or {})
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                response.read()
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            if response.status >= 400:
+                response.read()
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, None)
+            break
+        else:
+            raise urllib.error.HTTPError(url, response.status, "Too many redirects", response.headers, None)
+
+        try:
+            yield response
+        finally:
+            if method == "HEAD" or response.length == 0:
+                # There is no body, but http.client only releases the
+                # connection for the next request once read() is called
+                response.read()
+            # A partially read response leaves the connection unusable
+            if not response.isclosed():
+                self._connections.pop(key).close()
+            response.close()
+
+    def _request(self, method, url, headers):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        connection = self._connections.get(key)
+        if connection is not None:
+            try:
+                connection.request(method, path, headers=headers)
+                return key, connection.getresponse()
+            except (http.client.HTTPException, OSError):
+                # The server closed the idle connection, reconnect below
+                connection.close()
+        if parts.scheme == "https":
+            connection = http.client.HTTPSConnection(parts.netloc, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(parts.netloc, timeout=self.timeout)
+        self._connections[key] = connection
+        connection.request(method, path, headers=headers)
+        return key, connection.getresponse()
+
+
+def head(connections, url):
+    """Return the response headers of a HEAD request for url."""
+    with connections.open(url, method="HEAD") as response:
+        return response.headers
+
+
+def _is_up_to_date(jar_path, headers):
+    """
+    Check a JAR on disk against the headers of a HEAD request for it.
+
+    The JAR is up to date if it has the advertised Content-Length and the
+    ETag saved when it was installed matches the current one.
+    """
+    if headers is None or not jar_path.exists():
+        return False
+    etag = headers.get("ETag")
+    etag_path = Path(f"{jar_path}.etag")
+    if not etag or not etag_path.exists() or etag_path.read_text().strip() != etag:
+        return False
+    return str(jar_path.stat().st_size) == headers.get("Content-Length")
+
+
+def _save_etag(jar_path, etag):
+    if etag:
+        Path(f"{jar_path}.etag").write_text(etag)
+
+
+def _preallocate(fd, size):
+    """
+    Reserve disk space for a file of the given size.
+
+    Allocating the whole file up front lets the filesystem lay it out in
+    contiguous extents instead of growing it one write at a time. This is
+    skipped if the platform has no posix_fallocate().
+
+    Only segmented downloads use this, since they track their progress in a
+    separate state file. A single stream resumes from the size of its .part
+    file, which preallocation would make meaningless.
+    """
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        pass
+
+
+class DownloadSizeMismatch(Exception):
+    """A finished download does not have the size the server advertised."""
+
+
+def _check_size(part_path, expected_size):
+    """
+    Check a finished .part file against the size the server advertised.
+
+    The digest of a download is computed from the bytes received, so this
+    catches a .part file that something else wrote to at the same time. The
+    file is removed so that the next attempt starts afresh.
+    """
+    if not expected_size:
+        return
+    actual_size = part_path.stat().st_size
+    if actual_size != expected_size:
+        part_path.unlink()
+        raise DownloadSizeMismatch(f"{part_path} is {actual_size} bytes, expected {expected_size}")
+
+
+def _resume_headers(part_path, etag_path):
+    """
+    Build the request headers needed to resume a partial download.
+
+    Returns the number of bytes already on disk and the headers to send.
+    """
+    existing = part_path.stat().st_size if part_path.exists() else 0
+    headers = {}
+    if existing:
+        headers["Range"] = f"bytes={existing}-"
+        if etag_path.exists():
+            # Only resume if the remote file has not changed since the last attempt
+            headers["If-Range"] = etag_path.read_text().strip()
+    return existing, headers
+
+
+def _write_progress(line):
+    # Flush any text print() has buffered so the progress line lands after it
+    sys.stdout.flush()
+    buffer = getattr(sys.stdout, "buffer", None)
+    if buffer is None:
+        sys.stdout.write(line.decode())
+    else:
+        buffer.write(line)
+    sys.stdout.flush()
+
+
+def _print_lines(*lines, file=None):
+    """
+    Print lines with a single write.
+
+    print() writes the text and the line ending separately, so lines printed
+    at the same time by the download event loop and the thread that installs
+    finished downloads could otherwise run into each other.
+    """
+    file = sys.stdout if file is None else file
+    file.write("".join(f"{line}\n" for line in lines))
+
+
+def _progress_reporter(label=None):
+    """
+    Return a report_progress(downloaded, total_size, done=False) function.
+
+    On a terminal the progress line is redrawn at most once per
+    PROGRESS_INTERVAL. When stdout is a log file (as it is for Galaxy jobs) a
+    line is only written for every 10% of the download, to keep the log short.
+
+    The lines are prefixed with label, if given, to tell apart downloads that
+    run at the same time. Those always write whole lines, since redrawing one
+    line would mix them up.
+    """
+    interactive = sys.stdout.isatty() and label is None
+    prefix = b"" if label is None else label.encode() + b": "
+    last_report = 0.0
+    last_decile = -1
+
+    def report_progress(downloaded, total_size, done=False):
+        nonlocal last_report, last_decile
+        percent = min(100, (downloaded / total_size) * 100) if total_size > 0 else 0
+        if not done:
+            if not interactive and total_size > 0:
+                decile = int(percent // 10)
+                if decile == last_decile:
+                    return
+                last_decile = decile
+            else:
+                now = time.monotonic()
+                if now - last_report < PROGRESS_INTERVAL:
+                    return
+                last_report = now
+        elif not interactive and last_decile == 10:
+            # The final 100% line has already been written
+            return
+        line = prefix + b"Progress: %.1f%% (%.1f MB)" % (percent, downloaded / (1 << 20))
+        if interactive:
+            _write_progress(b"\r" + line + (b"\n" if done else b""))
+        else:
+            _write_progress(line + b"\n")
+
+    return report_progress
+
+
+class RangeNotSupported(Exception):
+    """The server answered a byte range request with the whole file."""
+
+
+class SegmentedDownloadStopped(Exception):
+    """Another segment of the download failed, so this one gave up early."""
+
+
+def _download_segment(url, fd, segment, etag, on_chunk, stop):
+    # segment is a [next offset, end offset] list that is updated as bytes are written
+    offset, end = segment
+    if offset > end:
+        return
+    headers = {"Range": f"bytes={offset}-{end}"}
+    if etag:
+        # Fall back to a single stream if the file changes between requests
+        headers["If-Range"] = etag
+    with ConnectionPool() as connections, connections.open(url, headers) as response:
+        if response.status != 206:
+            raise RangeNotSupported(url)
+        while offset <= end:
+            if stop.is_set():
+                raise SegmentedDownloadStopped(url)
+            chunk = response.read(min(DOWNLOAD_CHUNK_SIZE, end - offset + 1))
+            if not chunk:
+                raise http.client.IncompleteRead(b"", end - offset + 1)
+            os.pwrite(fd, chunk, offset)
+            offset += len(chunk)
+            on_chunk(segment, offset, len(chunk))
+
+
+def _segment_state_path(target_path):
+    return Path(f"{target_path}.part.segments")
+
+
+def _read_segment_state(target_path):
+    """Return the saved state of an interrupted segmented download, or None."""
+    state_path = _segment_state_path(target_path)
+    if not state_path.exists() or not Path(f"{target_path}.part").exists():
+        return None
+    try:
+        return json.loads(state_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _write_segment_state(target_path, state):
+    state_path = _segment_state_path(target_path)
+    tmp_path = Path(f"{state_path}.tmp")
+    tmp_path.write_text(json.dumps(state))
+    os.replace(tmp_path, state_path)
+
+
+def _discard_segmented_download(target_path):
+    Path(f"{target_path}.part").unlink(missing_ok=True)
+    _segment_state_path(target_path).unlink(missing_ok=True)
+
+
+def segmented_download(url, target_path, size, etag=None, algorithm="sha256", parts=DOWNLOAD_SEGMENTS):
+    """
+    Download a file as several byte ranges in parallel, each over its own connection.
+
+    How far each range has got is saved in "<target_path>.part.segments", at
+    most once per SEGMENT_STATE_INTERVAL and whenever the download fails, so
+    when a segment fails the remaining segments are stopped and the next call
+    only fetches the bytes that are still missing.
+
+    Returns the hex digest of the file. Raises RangeNotSupported if the server
+    does not honour the Range requests, in which case nothing is left on disk.
+    """
+    import threading
+    from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+    part_path = Path(f"{target_path}.part")
+    state = _read_segment_state(target_path)
+    resuming = state is not None and state.get("size") == size and state.get("etag") == etag
+    if resuming:
+        ranges = state["ranges"]
+        downloaded = size - sum(end - offset + 1 for offset, end in ranges)
+        print(f"Resuming segmented download at {downloaded / 1024 / 1024:.1f} MB")
+    else:
+        ranges = [[i * size // parts, (i + 1) * size // parts - 1] for i in range(parts)]
+        downloaded = 0
+        state = {"size": size, "etag": etag, "ranges": ranges}
+        print(f"Downloading in {parts} parallel segments")
+
+    report_progress = _progress_reporter()
+    lock = threading.Lock()
+    stop = threading.Event()
+    last_save = time.monotonic()
+
+    def on_chunk(segment, offset, n):
+        nonlocal downloaded, last_save
+        with lock:
+            segment[0] = offset
+            downloaded += n
+            now = time.monotonic()
+            if now - last_save >= SEGMENT_STATE_INTERVAL:
+                _write_segment_state(target_path, state)
+                last_save = now
+            report_progress(downloaded, size)
+
+    flags = os.O_WRONLY | os.O_CREAT | (0 if resuming else os.O_TRUNC)
+    fd = os.open(part_path, flags, 0o644)
+    try:
+        if not resuming:
+            os.ftruncate(fd, size)
+            _preallocate(fd, size)
+            _write_segment_state(target_path, state)
+        with ThreadPoolExecutor(len(ranges)) as executor:
+            futures = [
+                executor.submit(_download_segment, url, fd, segment, etag, on_chunk, stop)
+                for segment in ranges
+            ]
+            try:
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()
+            except BaseException:
+                # Stop the other segments after their current chunk rather
+                # than waiting for them to finish
+                stop.set()
+                for future in futures:
+                    future.cancel()
+                raise
+        os.fsync(fd)
+    except RangeNotSupported:
+        os.close(fd)
+        _discard_segmented_download(target_path)
+        raise
+    except BaseException:
+        # Keep the .part file and save its state so the next attempt can
+        # resume. The executor has waited for every segment to stop by now.
+        os.close(fd)
+        _write_segment_state(target_path, state)
+        raise
+    os.close(fd)
+    _save_etag(target_path, etag)
+    os.replace(part_path, target_path)
+    _segment_state_path(target_path).unlink(missing_ok=True)
+    report_progress(size, size, done=True)
+    # The segments arrive out of order, so the file has to be hashed afterwards
+    return file_checksum(target_path, algorithm)
+
+
+def _range_download_size(connections, url, headers=None):
+    """
+    Return the (size, etag) of the file at url if it is large enough to be
+    worth a segmented download and the server supports byte ranges, otherwise
+    (None, None).
+
+    headers are the response headers of an earlier HEAD request for url, if
+    there was one, otherwise a HEAD request is sent now.
+    """
+    if headers is None:
+        try:
+            headers = head(connections, url)
+        except urllib.error.HTTPError:
+            # Without a HEAD response, download the file as a single stream
+            return None, None
+    size = int(headers.get("Content-Length", 0))
+    if headers.get("Accept-Ranges") != "bytes" or size < SEGMENTED_DOWNLOAD_THRESHOLD:
+        return None, None
+    return size, headers.get("ETag")
+
+
+def _retry_delay(error, attempt):
+    """
+    Return the number of seconds to wait before retrying after error, or None
+    if the error is permanent (such as a 404) and retrying would not help.
+
+    Delays back off exponentially with jitter, unless the server sent a
+    Retry-After header. Either way the delay is capped at MAX_RETRY_DELAY.
+    """
+    import random
+    from datetime import datetime, timezone
+    from email.utils import parsedate_to_datetime
+
+    status = getattr(error, "status", None)
+    if isinstance(status, int) and status < 500 and status not in RETRY_STATUSES:
+        return None
+    headers = getattr(error, "headers", None)
+    retry_after = headers.get("Retry-After") if headers else None
+    if retry_after:
+        try:
+            return min(MAX_RETRY_DELAY, max(0.0, float(retry_after)))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(retry_after)
+            return min(MAX_RETRY_DELAY, max(0.0, (when - datetime.now(timezone.utc)).total_seconds()))
+        except (TypeError, ValueError):
+            pass
+    return min(MAX_RETRY_DELAY, 2 ** attempt) + random.uniform(0, 1)
+
+
+def download_model(connections, url, target_path, algorithm="sha256", head_headers=None):
     """
     Download a file from URL to target path with progress reporting.
+
+    The file is written to "<target_path>.part" and only renamed to the final
+    name once complete, so an interrupted download is resumed with an HTTP
+    Range request on the next attempt. Transient failures are retried up to
+    DOWNLOAD_ATTEMPTS times. The file is hashed as it is downloaded and the
+    hex digest is returned, or None if the download failed.
+
+    Large files that are not being resumed are fetched with segmented_download().
+    head_headers are the response headers of a HEAD request for url that has
+    already been made, and save sending another one to plan the download.
     """
     print(f"Downloading from {url}")
     print(f"Saving to {target_path}")
 
-    def report_progress(block_num, block_size, total_size):
-        downloaded = block_num * block_size
-        percent = min(100, (downloaded / total_size) * 100) if total_size > 0 else 0
-        print(f"\rProgress: {percent:.1f}% ({downloaded / 1024 / 1024:.1f} MB)", end="")
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        try:
+            digest = _fetch(connections, url, target_path, algorithm, head_headers)
+            print("Download complete!")
+            return digest
+        except Exception as e:
+            print(f"\nError downloading file: {e}", file=sys.stderr)
+            delay = _retry_delay(e, attempt)
+            if delay is None or attempt + 1 == DOWNLOAD_ATTEMPTS:
+                return None
+            print(f"Retrying in {delay:.1f} seconds (attempt {attempt + 2} of {DOWNLOAD_ATTEMPTS})")
+            time.sleep(delay)
+
+
+def _fetch(connections, url, target_path, algorithm, head_headers=None, segmented=True):
+    part_path = Path(f"{target_path}.part")
+    etag_path = Path(f"{target_path}.etag")
+    report_progress = _progress_reporter()
+
+    state = _read_segment_state(target_path)
+    if state is not None and not segmented:
+        _discard_segmented_download(target_path)
+        state = None
+
+    existing, headers = _resume_headers(part_path, etag_path)
+    if state is not None or (segmented and not existing):
+        if state is not None:
+            # Pick up an interrupted segmented download where it left off
+            size, etag = state["size"], state["etag"]
+        else:
+            size, etag = _range_download_size(connections, url, head_headers)
+        if size is not None:
+            try:
+                return segmented_download(url, target_path, size, etag, algorithm)
+            except RangeNotSupported:
+                print("\nServer ignored the byte ranges, downloading as a single stream")
+                return _fetch(connections, url, target_path, algorithm, segmented=False)
 
     try:
-        urllib.request.urlretrieve(url, target_path, reporthook=report_progress)
-        print()  # New line after progress
-        print("Download complete!")
-        return True
-    except Exception as e:
-        print(f"\nError downloading file: {e}", file=sys.stderr)
-        return False
+        with connections.open(url, headers) as response:
+            if response.status == 206:
+                print(f"Resuming download at {existing / 1024 / 1024:.1f} MB")
+                mode = "ab"
+                downloaded = existing
+            else:
+                # The server ignored the Range header, start over
+                mode = "wb"
+                downloaded = 0
+            h = _start_hash(algorithm, part_path if downloaded else None)
+            total_size = int(response.headers.get("Content-Length", 0))
+            if total_size:
+                total_size += downloaded
+            etag = response.headers.get("ETag")
+            if etag:
+                etag_path.write_text(etag)
+            with open(part_path, mode) as f:
+                while True:
+                    chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    h.update(chunk)
+                    downloaded += len(chunk)
+                    report_progress(downloaded, total_size)
+                f.flush()
+                os.fsync(f.fileno())
+            _check_size(part_path, total_size)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and existing:
+            # The partial file is not a prefix of the remote file, start over
+            part_path.unlink(missing_ok=True)
+            return _fetch(connections, url, target_path, algorithm, head_headers, segmented)
+        raise
+    os.replace(part_path, target_path)
+    report_progress(downloaded, downloaded, done=True)
+    return h.hexdigest()
+
+
+async def download_model_async(session, semaphore, url, target_path, algorithm="sha256"):
+    """
+    Download a file from URL to target path using an aiohttp session.
+
+    Partial downloads are resumed and retried the same way as in
+    download_model(), and the hex digest of the file is returned, or None if
+    the download failed.
+    """
+    import asyncio
+
+    async with semaphore:
+        _print_lines(f"Downloading from {url}")
+        for attempt in range(DOWNLOAD_ATTEMPTS):
+            try:
+                digest = await _fetch_async(session, url, target_path, algorithm)
+                _print_lines(f"Download complete: {target_path}")
+                return digest
+            except Exception as e:
+                # The partial file is kept so the next attempt can resume it
+                _print_lines(f"Error downloading {url}: {e}", file=sys.stderr)
+                delay = _retry_delay(e, attempt)
+                if delay is None or attempt + 1 == DOWNLOAD_ATTEMPTS:
+                    return None
+                _print_lines(f"Retrying {url} in {delay:.1f} seconds (attempt {attempt + 2} of {DOWNLOAD_ATTEMPTS})")
+                await asyncio.sleep(delay)
+
+
+async def _fetch_async(session, url, target_path, algorithm):
+    import aiofiles
+
+    part_path = Path(f"{target_path}.part")
+    etag_path = Path(f"{target_path}.etag")
+    report_progress = _progress_reporter(Path(target_path).name)
+
+    existing, headers = _resume_headers(part_path, etag_path)
+    async with session.get(url, headers=headers) as response:
+        if response.status == 416 and existing:
+            # The partial file is not a prefix of the remote file, start over
+            part_path.unlink()
+            restart = True
+        else:
+            restart = False
+            response.raise_for_status()
+            resumed = response.status == 206
+            downloaded = existing if resumed else 0
+            total_size = downloaded + response.content_length if response.content_length else 0
+            h = _start_hash(algorithm, part_path if resumed else None)
+            etag = response.headers.get("ETag")
+            if etag:
+                etag_path.write_text(etag)
+            async with aiofiles.open(part_path, "ab" if resumed else "wb") as f:
+                async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    await f.write(chunk)
+                    h.update(chunk)
+                    downloaded += len(chunk)
+                    report_progress(downloaded, total_size)
+                await f.flush()
+                os.fsync(f.fileno())
+            _check_size(part_path, total_size)
+    if restart:
+        return await _fetch_async(session, url, target_path, algorithm)
+    os.replace(part_path, target_path)
+    report_progress(downloaded, downloaded, done=True)
+    return h.hexdigest()
+
+
+async def _download_all(downloads, on_result):
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+
+    import aiohttp
+
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENT_DOWNLOADS)
+    # aiohttp's default 5 minute total timeout would cut off large JARs on slow
+    # links, so only limit how long connecting and each read may take
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=HTTP_TIMEOUT, sock_read=HTTP_TIMEOUT)
+    loop = asyncio.get_running_loop()
+    # on_result may copy a whole JAR, so it runs on a thread of its own to keep
+    # the other downloads flowing, and one call at a time as it would sequentially
+    with ThreadPoolExecutor(1) as callbacks:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+
+            async def download(i, url, path, algorithm):
+                try:
+                    digest = await download_model_async(session, semaphore, url, path, algorithm)
+                except Exception:
+                    digest = None
+                await loop.run_in_executor(callbacks, on_result, i, digest)
+
+            await asyncio.gather(
+                *[download(i, url, path, algorithm)
+                  for i, (url, path, algorithm, digest, head_headers) in enumerate(downloads)]
+            )
+
+
+# aria2c's names for the checksum algorithms Maven Central publishes
+ARIA2C_CHECKSUMS = {"sha256": "sha-256", "sha1": "sha-1"}
+
+
+def _try_external_downloader(downloads):
+    """
+    Download each (url, target_path, algorithm, digest, head_headers) tuple
+    with aria2c, if it is installed, which opens several connections per file
+    and resumes partial downloads with its own control files.
+
+    aria2c writes to "<target_path>.aria2c-part", and the file is only renamed
+    to target_path once it is complete and, when digest is known, matches it.
+
+    Returns the hex digest of each downloaded file, or None for failed
+    downloads, or None instead of a list if aria2c is not available.
+    """
+    import shutil
+    import subprocess
+    import tempfile
+
+    aria2c = shutil.which("aria2c")
+    if aria2c is None:
+        return None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = Path(tmp) / "downloads.txt"
+        with open(input_file, "w") as f:
+            for url, target_path, algorithm, digest, head_headers in downloads:
+                target = Path(target_path)
+                f.write(f"{url}\n  out={target.name}.aria2c-part\n  dir={target.parent}\n")
+                if digest is not None and algorithm in ARIA2C_CHECKSUMS:
+                    f.write(f"  checksum={ARIA2C_CHECKSUMS[algorithm]}={digest}\n")
+
+        print(f"Downloading {len(downloads)} file(s) with {aria2c}")
+        command = [
+            aria2c,
+            "-x", str(DOWNLOAD_SEGMENTS),
+            "-s", str(DOWNLOAD_SEGMENTS),
+            "-j", str(MAX_CONCURRENT_DOWNLOADS),
+            "-c",
+            "--auto-file-renaming=false",
+            "--allow-overwrite=true",
+            f"--summary-interval={30 if not sys.stdout.isatty() else 1}",
+            "-i", str(input_file)
+        ]
+        try:
+            # Output goes straight to our stdout/stderr, and so into the Galaxy job log
+            sys.stdout.flush()
+            subprocess.run(command, check=False)
+        except OSError as e:
+            print(f"Could not run aria2c: {e}", file=sys.stderr)
+            return None
+
+    results = []
+    for url, target_path, algorithm, digest, head_headers in downloads:
+        part_path = Path(f"{target_path}.aria2c-part")
+        control_path = Path(f"{part_path}.aria2")
+        # aria2c keeps a .aria2 control file next to downloads it did not finish
+        if part_path.exists() and not control_path.exists():
+            actual = file_checksum(part_path, algorithm)
+            if digest is None or actual == digest:
+                os.replace(part_path, target_path)
+                results.append(actual)
+                continue
+            print(f"Checksum mismatch for {url}", file=sys.stderr)
+        else:
+            print(f"aria2c failed to download {url}", file=sys.stderr)
+        # The Python downloaders keep their own .part files
+        part_path.unlink(missing_ok=True)
+        control_path.unlink(missing_ok=True)
+        results.append(None)
+    return results
+
+
+def _have_aiohttp():
+    """
+    Return True if the optional aiohttp and aiofiles modules are installed.
+
+    They, and asyncio, are only imported by the functions that use them when
+    several files are downloaded at once: importing them takes longer than
+    everything else the script does at startup put together.
+    """
+    return all(importlib.util.find_spec(name) is not None for name in ("aiohttp", "aiofiles"))
+
+
+def download_all(connections, downloads, on_result=None):
+    """
+    Download each (url, target_path, algorithm, digest, head_headers) tuple,
+    where digest is the expected checksum or None, and head_headers are the
+    response headers of a HEAD request for url or None if there was none.
+
+    aria2c is used when it is installed. Anything it does not manage to
+    download is fetched concurrently with aiohttp when that is available,
+    and otherwise one file after another over the keep-alive connections in
+    the ConnectionPool. A single file gains nothing from downloading files
+    concurrently, so it always goes through download_model() which splits it
+    into parallel segments.
+
+    If given, on_result(index, digest) is called as soon as each download
+    finishes, in whatever order they finish. Calls are never made concurrently.
+
+    Returns the hex digest of each downloaded file, or None for failed downloads.
+    """
+    if not downloads:
+        return []
+
+    results = _try_external_downloader(downloads) or [None] * len(downloads)
+    remaining = [i for i, result in enumerate(results) if result is None]
+
+    def finished(i, digest):
+        results[i] = digest
+        if on_result is not None:
+            on_result(i, digest)
+
+    for i, digest in enumerate(results):
+        if digest is not None:
+            finished(i, digest)
+    if not remaining:
+        return results
+
+    if len(remaining) > 1 and _have_aiohttp():
+        import asyncio
+
+        asyncio.run(_download_all(
+            [downloads[i] for i in remaining],
+            lambda j, digest: finished(remaining[j], digest)
+        ))
+    else:
+        for i in remaining:
+            url, path, algorithm, digest, head_headers = downloads[i]
+            finished(i, download_model(connections, url, path, algorithm, head_headers))
+    return results
+
+
+def fetch_checksum(connections, url):
+    """
+    Fetch the checksum Maven Central publishes alongside an artifact.
+
+    Returns an (algorithm, hexdigest) tuple, or (None, None) if no checksum
+    sidecar could be retrieved.
+    """
+    for algorithm in CHECKSUM_ALGORITHMS:
+        try:
+            with connections.open(f"{url}.{algorithm}") as response:
+                # Some sidecars are "<digest>  <filename>" rather than just the digest
+                return algorithm, response.read().decode().split()[0].lower()
+        except (urllib.error.URLError, http.client.HTTPException, OSError, IndexError, UnicodeDecodeError):
+            continue
+    return None, None
+
+
+def _hash_file(algorithm, path):
+    """
+    Hash a file on disk, returning the hash object so more data can be added.
+
+    hashlib.file_digest() (Python 3.11+) reads straight into a reusable buffer
+    and hands it to OpenSSL, which uses the CPU's SHA extensions when present
+    (OpenSSL 1.1.1 or later). Older Pythons fall back to a plain read loop.
+    """
+    with open(path, "rb") as f:
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(f, algorithm)
+        h = hashlib.new(algorithm)
+        while True:
+            chunk = f.read(DOWNLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h
+
+
+def _start_hash(algorithm, part_path=None):
+    """Start hashing a download, seeded with any partial file already on disk."""
+    if part_path is not None:
+        return _hash_file(algorithm, part_path)
+    return hashlib.new(algorithm)
+
+
+def file_checksum(path, algorithm):
+    """Compute the hex digest of a file on disk."""
+    return _hash_file(algorithm, path).hexdigest()
+
+
+def is_complete_jar(path):
+    """
+    Check that a JAR ends with a ZIP end of central directory record.
+
+    The record is written last, so a truncated download will not have one.
+    Only the tail of the file is read: the record is 22 bytes plus a comment
+    of at most 64 KiB.
+    """
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - ZIP_EOCD_SEARCH_SIZE))
+        return ZIP_EOCD_SIGNATURE in f.read()
+
+
+def _cache_path(jar_name, algorithm, digest):
+    return CACHE_DIR / algorithm / digest / jar_name
+
+
+@contextlib.contextmanager
+def _cache_lock(cache_path):
+    """
+    Hold an exclusive lock on a cache entry.
+
+    The cache may be shared by several Galaxy job handlers, and two runs
+    downloading the same JAR would otherwise write to the same .part file.
+    The lock is held from the download until the JAR has been verified and
+    moved into place.
+    """
+    import fcntl
+
+    with open(f"{cache_path}.lock", "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Waiting for another run to finish downloading {cache_path}")
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _cache_lookup(jar_name, algorithm, digest):
+    """
+    Return the path of a cached copy of the JAR, or None on a cache miss.
+
+    A cached file that no longer matches its digest is evicted and treated as
+    a miss, so that it is downloaded again rather than linked into place.
+    """
+    cached = _cache_path(jar_name, algorithm, digest)
+    if not cached.exists():
+        return None
+    if file_checksum(cached, algorithm) != digest:
+        print(f"Removing damaged cache entry {cached}", file=sys.stderr)
+        cached.unlink()
+        return None
+    return cached
+
+
+# Errors from os.link() that mean the file has to be copied instead
+_LINK_ERRORS = {errno.EXDEV, errno.EPERM, errno.EMLINK}
+
+
+def link_or_copy(source, target):
+    """
+    Hard link source to target, copying instead across filesystems.
+
+    The link or copy is made under a temporary name and renamed over target,
+    so an existing file at target is replaced rather than written through,
+    which would also change every other link to it.
+    """
+    tmp_path = f"{target}.tmp"
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError as e:
+        if e.errno not in _LINK_ERRORS:
+            raise
+        copy_file(source, target)
+        return
+    os.replace(tmp_path, target)
+
+
+# Kernel-side copy functions, tried in order by copy_file(). Each copies up to
+# count bytes from the current position of in_fd and returns the number copied.
+_KERNEL_COPIES = (
+    lambda in_fd, out_fd, count: os.copy_file_range(in_fd, out_fd, count),
+    lambda in_fd, out_fd, count: os.sendfile(out_fd, in_fd, None, count),
+)
+
+
+def copy_file(source, target):
+    """
+    Copy source to target without moving the data through Python.
+
+    copy_file_range() lets filesystems that support it (Btrfs, XFS, NFS 4.2)
+    share or clone extents instead of copying them, and sendfile() copies
+    inside the kernel. Whatever those cannot copy, for example on platforms
+    that lack them, is copied with an ordinary read/write loop.
+
+    The copy is written to a temporary file and renamed over target once complete.
+    """
+    tmp_path = f"{target}.tmp"
+    # A leftover temporary file may be a hard link to a cached JAR
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(tmp_path)
+    try:
+        _copy_data(source, tmp_path)
+        os.replace(tmp_path, target)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _copy_data(source, target):
+    import shutil
+
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        in_fd, out_fd = src.fileno(), dst.fileno()
+        remaining = os.fstat(in_fd).st_size
+        for kernel_copy in _KERNEL_COPIES:
+            try:
+                while remaining:
+                    copied = kernel_copy(in_fd, out_fd, min(remaining, 1 << 30))
+                    if not copied:
+                        break
+                    remaining -= copied
+            except (AttributeError, OSError):
+                continue
+            break
+        if remaining:
+            shutil.copyfileobj(src, dst, DOWNLOAD_CHUNK_SIZE)
+
+
+def _banner(message):
+    """Print a message between two separator lines with a single write."""
+    print(f"\n{SEPARATOR}\n{message}\n{SEPARATOR}")
+
+
+def write_output(output_path, data_manager_output):
+    """
+    Write the data manager JSON output.
+
+    The file is replaced atomically so it always holds a complete JSON
+    document, even if the data manager dies part way through registering models.
+    """
+    if orjson is not None:
+        payload = orjson.dumps(data_manager_output, option=orjson.OPT_INDENT_2)
+    else:
+        payload = json.dumps(data_manager_output, indent=2).encode()
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, output_path)
 
 
 def load_existing_models(data_table_path):
     """Load existing model entries from the data table to avoid duplicates."""
-    existing = set()
-    if data_table_path and Path(data_table_path).exists():
-        with open(data_table_path) as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#'):
-                    parts = line.split('\t')
-                    if parts:
-                        existing.add(parts[0])  # Add the value (first column)
-    return existing
+    if not data_table_path or not Path(data_table_path).exists():
+        return set()
+    # Read the whole table in one go and only decode the value (first column)
+    lines = (line.strip() for line in Path(data_table_path).read_bytes().splitlines())
+    return {
+        line.split(b"\t", 1)[0].decode()
+        for line in lines
+        if line and not line.startswith(b"#")
+    }
 
 
-def main():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description="Download and register CoreNLP language models")
     parser.add_argument("--language", action="append", choices=LANGUAGE_MODELS.keys(),
                         help="Language code(s) for the model(s) to download (can be specified multiple times)")
@@ -116,112 +1095,228 @@ def main():
     parser.add_argument("--data-table", required=False,
                         help="Path to existing data table file to check for duplicates")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Require at least one option
     if not args.language and not args.common_models:
         parser.error("At least one of --language or --common-models must be specified")
 
+    return args
+
+
+def main():
+    args = parse_args()
+
     # Load existing models to avoid duplicates
     existing_models = load_existing_models(args.data_table)
 
-    # Create target directory
+    # Create target directory. It is resolved once so that every path written
+    # to the data table is absolute and canonical.
     target_dir = Path(args.target_directory)
     target_dir.mkdir(parents=True, exist_ok=True)
+    target_dir = target_dir.resolve()
 
-    # List to collect all data table entries
-    data_table_entries = []
+    # Collect the models that need to be processed as (model_info, jar_path) pairs
+    requested = []
+
+    # Outcome for each requested model: "ok", "failed" or "skipped"
+    status = {}
 
-    # Process common models if requested
     if args.common_models:
         if "common" in existing_models:
-            print(f"\n{'=' * 60}")
-            print(f"Skipping {COMMON_MODELS['name']} - already in data table")
-            print(f"{'=' * 60}")
+            _banner(f"Skipping {COMMON_MODELS.name} - already in data table")
+            status["common"] = "skipped"
         else:
-            print(f"\n{'=' * 60}")
-            print(f"Processing {COMMON_MODELS['name']}...")
-            print(f"{'=' * 60}")
+            requested.append((COMMON_MODELS, target_dir / COMMON_MODELS.jar_name))
 
-            # Download common models JAR
-            jar_path = target_dir / COMMON_MODELS["jar_name"]
-
-            if jar_path.exists():
-                print(f"Model already exists at {jar_path}")
-            else:
-                if not download_model(COMMON_MODELS["url"], str(jar_path)):
-                    print(f"WARNING: Failed to download {COMMON_MODELS['name']}", file=sys.stderr)
-                else:
-                    print(f"Successfully downloaded {COMMON_MODELS['name']}")
-
-            # Prepare data table entry for common models
-            data_table_entries.append({
-                "value": "common",
-                "name": COMMON_MODELS["name"],
-                "lang_code": "common",
-                "models_path": str(jar_path.absolute())
-            })
-
-            print(f"Successfully registered {COMMON_MODELS['name']}")
-            print(f"  Value: common")
-            print(f"  Language code: common")
-            print(f"  Path: {jar_path.absolute()}")
-
-    # Process each language
     if args.language:
-        for lang_code in args.language:
+        # dict.fromkeys() drops repeated language codes but keeps their order
+        for lang_code in dict.fromkeys(args.language):
             if lang_code in existing_models:
-                print(f"\n{'=' * 60}")
-                print(f"Skipping {LANGUAGE_MODELS[lang_code]['name']} - already in data table")
-                print(f"{'=' * 60}")
+                _banner(f"Skipping {LANGUAGE_MODELS[lang_code].name} - already in data table")
+                status[lang_code] = "skipped"
             else:
-                print(f"\n{'=' * 60}")
-                print(f"Processing {LANGUAGE_MODELS[lang_code]['name']} model...")
-                print(f"{'=' * 60}")
-
                 model_info = LANGUAGE_MODELS[lang_code]
+                requested.append((model_info, target_dir / model_info.jar_name))
 
-                # Download model JAR
-                jar_path = target_dir / model_info["jar_name"]
+    # List to collect all data table entries
+    data_table_entries = []
 
-                if jar_path.exists():
-                    print(f"Model already exists at {jar_path}")
-                else:
-                    if not download_model(model_info["url"], str(jar_path)):
-                        print(f"WARNING: Failed to download {model_info['name']} model", file=sys.stderr)
-                        continue  # Skip this model but continue with others
-
-                # Prepare data table entry
-                value = lang_code
-                name = model_info["name"]
-                models_path = str(jar_path.absolute())
-
-                data_table_entries.append({
-                    "value": value,
-                    "name": name,
-                    "lang_code": lang_code,
-                    "models_path": models_path
-                })
-
-                print(f"Successfully registered {name} model")
-                print(f"  Value: {value}")
-                print(f"  Language code: {lang_code}")
-                print(f"  Path: {models_path}")
-
-    # Create data manager JSON output
+    # Models that could not be downloaded, keyed by value, so a later run can
+    # retry just these
+    failures = {}
+
+    # Create data manager JSON output. Galaxy merges every top-level key into
+    # a dict with dict.update(), so "status" and "failures" must be mappings
+    # too; they are there for admins and scripts that want to retry the
+    # failed models. The output is rewritten as each model is registered or
+    # fails, so that it is usable even if the data manager dies part way through.
     data_manager_output = {
         "data_tables": {
             "corenlp_models": data_table_entries
-        }
+        },
+        "status": status,
+        "failures": failures
     }
 
-    # Write output JSON
-    with open(args.output, "w") as f:
-        json.dump(data_manager_output, f, indent=2)
+    # Position of each model in the request, which the data table rows keep
+    # whatever order the downloads finish in
+    request_order = {model_info.code: i for i, (model_info, jar_path) in enumerate(requested)}
+
+    def register(model_info, jar_path):
+        value = model_info.code
+
+        # Prepare data table entry
+        name = model_info.name
+        lang_code = value
+        models_path = str(jar_path)
+
+        data_table_entries.append({
+            "value": value,
+            "name": name,
+            "lang_code": lang_code,
+            "models_path": models_path
+        })
+        data_table_entries.sort(key=lambda entry: request_order[entry["value"]])
+
+        _print_lines(
+            f"Successfully registered {name}",
+            f"  Value: {value}",
+            f"  Language code: {lang_code}",
+            f"  Path: {models_path}"
+        )
+        status[value] = "ok"
+        write_output(args.output, data_manager_output)
+
+    def fail(model_info):
+        value = model_info.code
+        _print_lines(f"WARNING: Failed to download {model_info.name}", file=sys.stderr)
+        status[value] = "failed"
+        failures[value] = {
+            "name": model_info.name,
+            "url": model_info.url
+        }
+        write_output(args.output, data_manager_output)
+
+    # Work out which model JARs still need to be downloaded, and where to.
+    # A HEAD request per model fails fast on missing models and recognises
+    # JARs that are already up to date without reading them. Whenever Maven
+    # Central publishes a checksum the JAR is downloaded into the shared
+    # cache and linked into the target directory from there.
+    remote_etags = {}
+    with ConnectionPool() as connections:
+        pending = []
+        for model_info, jar_path in requested:
+            _banner(f"Processing {model_info.name}...")
+            try:
+                headers = head(connections, model_info.url)
+            except urllib.error.HTTPError as e:
+                if e.code in MISSING_STATUSES:
+                    print(f"{model_info.name} is not available: {e}", file=sys.stderr)
+                    fail(model_info)
+                    continue
+                # Some servers refuse HEAD requests, so let the download decide
+                headers = None
+            except (urllib.error.URLError, http.client.HTTPException, OSError):
+                # Leave it to the download to retry or report the problem
+                headers = None
+
+            if headers is not None and headers.get("ETag"):
+                remote_etags[jar_path] = headers["ETag"]
+            if _is_up_to_date(jar_path, headers):
+                print(f"{model_info.name} is up to date at {jar_path}")
+                register(model_info, jar_path)
+                continue
+
+            algorithm, digest = fetch_checksum(connections, model_info.url)
+
+            if jar_path.exists():
+                if digest is None:
+                    intact = is_complete_jar(jar_path)
+                else:
+                    intact = file_checksum(jar_path, algorithm) == digest
+                if intact:
+                    print(f"{model_info.name} already exists at {jar_path}")
+                    _save_etag(jar_path, remote_etags.get(jar_path))
+                    register(model_info, jar_path)
+                    continue
+                print(f"{jar_path} is damaged or out of date, downloading it again")
+                jar_path.unlink()
+
+            download_path = jar_path
+            if digest is not None:
+                cached = _cache_lookup(model_info.jar_name, algorithm, digest)
+                if cached is not None:
+                    print(f"Using cached copy of {model_info.name} from {cached}")
+                    link_or_copy(cached, jar_path)
+                    _save_etag(jar_path, remote_etags.get(jar_path))
+                    register(model_info, jar_path)
+                    continue
+                cache_path = _cache_path(model_info.jar_name, algorithm, digest)
+                try:
+                    cache_path.parent.mkdir(parents=True, exist_ok=True)
+                    download_path = cache_path
+                except OSError as e:
+                    print(f"Cache directory unavailable, downloading directly: {e}", file=sys.stderr)
+
+            pending.append((model_info, str(download_path), jar_path, algorithm, digest, headers))
+
+        with contextlib.ExitStack() as cache_locks:
+            # Lock the cache entries in a fixed order, so that two runs
+            # wanting the same JARs cannot each end up waiting for the other
+            for download_path in sorted(p[1] for p in pending if p[1] != str(p[2])):
+                cache_locks.enter_context(_cache_lock(Path(download_path)))
+            queued = []
+            for model_info, download_path, jar_path, algorithm, digest, headers in pending:
+                # Another run may have downloaded the JAR while we waited for the lock
+                if download_path != str(jar_path) and _cache_lookup(model_info.jar_name, algorithm, digest):
+                    print(f"Using cached copy of {model_info.name} from {download_path}")
+                    link_or_copy(download_path, jar_path)
+                    _save_etag(jar_path, remote_etags.get(jar_path))
+                    register(model_info, jar_path)
+                else:
+                    queued.append((model_info, download_path, jar_path, algorithm, digest, headers))
+            pending = queued
+
+            def downloaded(i, actual):
+                model_info, download_path, jar_path, algorithm, digest, headers = pending[i]
+                ok = actual is not None
+                try:
+                    if ok and digest is not None and actual != digest:
+                        _print_lines(f"Checksum mismatch for {model_info.url}", file=sys.stderr)
+                        os.unlink(download_path)
+                        ok = False
+                    elif ok and digest is None and not is_complete_jar(download_path):
+                        # Without a checksum, at least make sure the archive is not truncated
+                        _print_lines(f"Incomplete JAR downloaded from {model_info.url}", file=sys.stderr)
+                        os.unlink(download_path)
+                        ok = False
+                    if ok:
+                        if download_path != str(jar_path):
+                            link_or_copy(download_path, jar_path)
+                        _save_etag(jar_path, remote_etags.get(jar_path))
+                except OSError as e:
+                    # Carry on with the other models, as for a failed download
+                    _print_lines(f"Could not install {model_info.name}: {e}", file=sys.stderr)
+                    ok = False
+                if ok:
+                    register(model_info, jar_path)
+                else:
+                    fail(model_info)
+
+            download_all(connections, [
+                (model_info.url, download_path, algorithm or "sha256", digest, headers)
+                for model_info, download_path, jar_path, algorithm, digest, headers in pending
+            ], on_result=downloaded)
+
+    # Write the final output JSON, which also covers the case where every
+    # requested model was skipped
+    write_output(args.output, data_manager_output)
 
-    print(f"\n{'=' * 60}")
-    print(f"Summary: Successfully registered {len(data_table_entries)} model(s)")
-    print(f"{'=' * 60}")
+    summary = f"Summary: Successfully registered {len(data_table_entries)} model(s)"
+    if failures:
+        summary += f"\nFailed to download: {', '.join(failures)}"
+    _banner(summary)
 
 
 if __name__ == "__main__":